@@ -48,19 +48,25 @@ if True: # True | False
 if "bpy" in locals():
     import importlib
     importlib.reload(import_vtu)
+    importlib.reload(import_fistr)
     importlib.reload(import_vtu_sequence)
+    importlib.reload(section_view)
 else:
     import bpy
     from . import import_vtu
+    from . import import_fistr
     from . import import_vtu_sequence
+    from . import section_view
 
 def register():
     import_vtu.register()
     import_vtu_sequence.register()
+    section_view.register()
 
 def unregister():
     import_vtu.unregister()
     import_vtu_sequence.unregister()
+    section_view.unregister()
 
 if __name__ == "__main__":
     register()
@@ -0,0 +1,311 @@
+
+import os
+import re
+import mmap
+import numpy
+import pathlib
+import vtk
+from vtk.util.numpy_support import numpy_to_vtk, numpy_to_vtkIdTypeArray
+
+from .import_vtu import VtuData
+
+
+# HEC-MW element type -> (VTK cell type, number of nodes in the file, node order for VTK)
+FISTR_ELEMENT_TYPES = {
+    111: (vtk.VTK_LINE, 2, [0,1]),
+    112: (vtk.VTK_QUADRATIC_EDGE, 3, [0,1,2]),
+    231: (vtk.VTK_TRIANGLE, 3, [0,1,2]),
+    232: (vtk.VTK_QUADRATIC_TRIANGLE, 6, [0,1,2,5,3,4]),
+    241: (vtk.VTK_QUAD, 4, [0,1,2,3]),
+    242: (vtk.VTK_QUADRATIC_QUAD, 8, [0,1,2,3,4,5,6,7]),
+    341: (vtk.VTK_TETRA, 4, [0,1,2,3]),
+    342: (vtk.VTK_QUADRATIC_TETRA, 10, [0,1,2,3,6,4,5,7,8,9]),
+    351: (vtk.VTK_WEDGE, 6, [0,1,2,3,4,5]),
+    352: (vtk.VTK_QUADRATIC_WEDGE, 15, [0,1,2,3,4,5,8,6,7,11,9,10,12,13,14]),
+    361: (vtk.VTK_HEXAHEDRON, 8, [0,1,2,3,4,5,6,7]),
+    362: (vtk.VTK_QUADRATIC_HEXAHEDRON, 20, list(range(20))),
+    611: (vtk.VTK_LINE, 2, [0,1]),
+    641: (vtk.VTK_LINE, 4, [0,1]),
+    731: (vtk.VTK_TRIANGLE, 3, [0,1,2]),
+    741: (vtk.VTK_QUAD, 4, [0,1,2,3]),
+}
+
+
+def is_fistr_file(filepath):
+    name = pathlib.Path(filepath).name
+    return name.endswith(".msh") or re.search(r"\.res(\.\d+\.\d+)?$", name) is not None
+
+def parse_numbers(buffer, start, end, dtype=numpy.float64, chunksize=1<<26):
+    # Parse whitespace/comma separated numbers of buffer[start:end] with numpy,
+    # in chunks split at line breaks so that a large block is never copied as a whole
+    ret = []
+    while start < end:
+        stop = end
+        if end-start > chunksize:
+            stop = buffer.rfind(b"\n", start, start+chunksize)
+            if stop <= start:
+                stop = end
+        text = buffer[start:stop]
+        if b"#" in text or b"!!" in text:
+            text = re.sub(rb"(?m)^\s*(#|!!).*$", b"", text)
+        ret.append(numpy.fromstring(text.replace(b",", b" "), dtype=dtype, sep=" "))
+        start = stop
+    if not ret:
+        return numpy.zeros(0, dtype=dtype)
+    return numpy.concatenate(ret) if len(ret) > 1 else ret[0]
+
+def find_rank_files(filepath):
+    # "<name>.<rank>.<step>" -> result files of all ranks for the same step
+    filepath = pathlib.Path(filepath)
+    match = re.match(r"^(.*)\.(\d+)\.(\d+)$", filepath.name)
+    if not match:
+        return [filepath]
+    base,rank,step = match.groups()
+    pattern = re.compile(rf"^{re.escape(base)}\.(\d+)\.{step}$")
+    ranks = []
+    for entry in os.scandir(filepath.parent):
+        match = pattern.match(entry.name)
+        if match:
+            ranks.append((int(match.group(1)),filepath.parent/entry.name))
+    return [path for rank,path in sorted(ranks)]
+
+def result_group_key(filepath):
+    # Identifies the rank files that belong to the same step
+    filepath = pathlib.Path(filepath)
+    match = re.match(r"^(.*)\.(\d+)\.(\d+)$", filepath.name)
+    if not match:
+        return str(filepath)
+    return str(filepath.parent/f"{match.group(1)}.*.{match.group(3)}")
+
+def find_mesh_file(filepath):
+    # Look for the mesh of a result file: hecmw_ctrl.dat first, then a single *.msh file
+    filepath = pathlib.Path(filepath)
+    for directory in [filepath.parent, filepath.parent.parent]:
+        ctrl = directory/"hecmw_ctrl.dat"
+        if ctrl.exists():
+            match = re.search(r"!MESH\s*,[^\n]*NAME\s*=\s*fstrMSH[^\n]*\n\s*(\S+)", ctrl.read_text(errors="replace"), re.IGNORECASE)
+            if match and (directory/match.group(1)).exists():
+                return directory/match.group(1)
+        meshes = sorted(directory.glob("*.msh"))
+        if len(meshes) == 1:
+            return meshes[0]
+    raise ValueError(f"Mesh file not found for {str(filepath)!r}")
+
+
+class FistrMesh:
+    def __init__(self,filepath=None):
+        self.clear()
+        if filepath:
+            self.read(filepath)
+    def clear(self):
+        self.node_ids_ = numpy.zeros(0,dtype=numpy.int64)
+        self.points_ = numpy.zeros((0,3))
+        self.elem_ids_ = numpy.zeros(0,dtype=numpy.int64)
+        self.connectivity_ = numpy.zeros(0,dtype=numpy.int64)
+        self.offsets_ = numpy.zeros(1,dtype=numpy.int64)
+        self.types_ = numpy.zeros(0,dtype=numpy.uint8)
+        self.node_sorter_ = None
+        self.elem_sorter_ = None
+        return self
+    def read(self,filepath):
+        self.clear()
+        node_blocks = []
+        elem_blocks = []
+        with open(filepath,"rb") as f, mmap.mmap(f.fileno(),0,access=mmap.ACCESS_READ) as buffer:
+            headers = [(m.start(),m.end(),m.group(1).upper()) for m in re.finditer(rb"(?m)^!(?!!)([^\n]*)$",buffer)]
+            for i,(start,end,header) in enumerate(headers):
+                block_end = headers[i+1][0] if i+1 < len(headers) else len(buffer)
+                keyword = header.split(b",")[0].strip()
+                if keyword == b"NODE":
+                    values = parse_numbers(buffer,end,block_end)
+                    if values.size % 4 != 0:
+                        raise ValueError(f"Invalid !NODE block in {str(filepath)!r}")
+                    node_blocks.append(values.reshape(-1,4))
+                elif keyword == b"ELEMENT":
+                    match = re.search(rb"TYPE\s*=\s*(\d+)",header)
+                    elem_type = int(match.group(1)) if match else None
+                    if elem_type not in FISTR_ELEMENT_TYPES:
+                        print(f"Skipping unsupported element type: {elem_type}")
+                        continue
+                    vtk_type,nnodes,order = FISTR_ELEMENT_TYPES[elem_type]
+                    values = parse_numbers(buffer,end,block_end,dtype=numpy.int64)
+                    if values.size % (nnodes+1) != 0:
+                        raise ValueError(f"Invalid !ELEMENT block (TYPE={elem_type}) in {str(filepath)!r}")
+                    values = values.reshape(-1,nnodes+1)
+                    elem_blocks.append((vtk_type,values[:,0],values[:,1:][:,order]))
+                elif keyword == b"END":
+                    break
+        if node_blocks:
+            nodes = numpy.concatenate(node_blocks)
+            self.node_ids_ = nodes[:,0].astype(numpy.int64)
+            self.points_ = numpy.ascontiguousarray(nodes[:,1:4])
+            self.node_sorter_ = id_sorter(self.node_ids_)
+        if elem_blocks:
+            self.elem_ids_ = numpy.concatenate([ids for vtk_type,ids,nodes in elem_blocks])
+            self.elem_sorter_ = id_sorter(self.elem_ids_)
+            self.connectivity_ = numpy.concatenate([self.node_index(nodes.ravel()) for vtk_type,ids,nodes in elem_blocks])
+            if numpy.any(self.connectivity_ < 0):
+                raise ValueError(f"Undefined node referenced by !ELEMENT in {str(filepath)!r}")
+            sizes = numpy.concatenate([numpy.full(len(ids),nodes.shape[1]) for vtk_type,ids,nodes in elem_blocks])
+            self.offsets_ = numpy.concatenate([[0],numpy.cumsum(sizes)]).astype(numpy.int64)
+            self.types_ = numpy.concatenate([numpy.full(len(ids),vtk_type,dtype=numpy.uint8) for vtk_type,ids,nodes in elem_blocks])
+        return self
+    def node_index(self,node_ids):
+        # Node IDs -> indices into points_ (-1 if not found)
+        return lookup_ids(self.node_ids_,self.node_sorter_,node_ids)
+    def elem_index(self,elem_ids):
+        # Element IDs -> cell indices (-1 if not found)
+        return lookup_ids(self.elem_ids_,self.elem_sorter_,elem_ids)
+    def to_ugrid(self):
+        ugrid = vtk.vtkUnstructuredGrid()
+        points = vtk.vtkPoints()
+        points.SetData(numpy_to_vtk(self.points_,deep=True))
+        ugrid.SetPoints(points)
+        cells = vtk.vtkCellArray()
+        cells.SetData(numpy_to_vtkIdTypeArray(self.offsets_,deep=True),numpy_to_vtkIdTypeArray(self.connectivity_,deep=True))
+        ugrid.SetCells(numpy_to_vtk(self.types_,deep=True,array_type=vtk.VTK_UNSIGNED_CHAR),cells)
+        return ugrid
+
+
+def id_sorter(ids):
+    # None if the IDs are numbered 1..n in order (direct indexing), else the sorting permutation
+    if len(ids) == 0 or (ids[0] == 1 and ids[-1] == len(ids) and numpy.all(numpy.diff(ids) == 1)):
+        return None
+    return numpy.argsort(ids,kind="stable")
+
+def lookup_ids(ids,sorter,query):
+    # Vectorized ID lookup (-1 if not found)
+    if len(ids) == 0:
+        return numpy.full(len(query),-1,dtype=numpy.int64)
+    if sorter is None:
+        index = query.astype(numpy.int64)-1
+        index[(index < 0) | (index >= len(ids))] = -1
+        return index
+    pos = numpy.searchsorted(ids,query,sorter=sorter)
+    index = sorter[numpy.clip(pos,0,len(ids)-1)]
+    index[ids[index] != query] = -1
+    return index
+
+# A label line (e.g. "DISPLACEMENT") at a given position
+RESULT_LABEL_PATTERN = re.compile(rb"\s*([A-Za-z_][^\s]*)")
+
+def find_token(buffer, start, end, n, chunksize=1<<26):
+    # Position of the n-th (from 0) whitespace/comma separated token of buffer[start:end],
+    # or end if there are fewer tokens. The chunks grow so that a short lookup stays cheap.
+    data = numpy.frombuffer(buffer, dtype=numpy.uint8)
+    previous_space = True
+    size = 4096
+    while start < end:
+        chunk = data[start:min(start+size,end)]
+        space = (chunk <= 32) | (chunk == 44)
+        first = ~space
+        first[1:] &= space[:-1]
+        first[0] &= previous_space
+        count = int(numpy.count_nonzero(first))
+        if n < count:
+            return start+int(numpy.flatnonzero(first)[n])
+        n -= count
+        previous_space = bool(space[-1])
+        start += len(chunk)
+        size = min(size*2,chunksize)
+    return end
+
+def read_result_labels(buffer, pos, end, n):
+    # n label lines from pos: returns (labels, position after the last label)
+    labels = []
+    for i in range(n):
+        match = RESULT_LABEL_PATTERN.match(buffer,pos,end)
+        if match is None:
+            return None,pos
+        labels.append(match.group(1).decode())
+        pos = match.end()
+    return labels,pos
+
+def read_result_file(filepath):
+    # FrontISTR text result (*fstrresult): returns (node_ids, {label: values}, elem_ids, {label: values})
+    with open(filepath,"rb") as f, mmap.mmap(f.fileno(),0,access=mmap.ACCESS_READ) as buffer:
+        start = buffer.find(b"*data")
+        if start < 0:
+            raise ValueError(f"Invalid result file: {str(filepath)!r}")
+        start = buffer.find(b"\n",start)+1
+        end = buffer.find(b"*END",start)
+        if end < 0:
+            end = len(buffer)
+        # n_node n_elem / nn_component ne_component / nn_dof, node labels, node values,
+        # ne_dof, element labels, element values: sections are located by counting tokens,
+        # so values (e.g. NAN alone on a line) are never taken as labels
+        counts = parse_numbers(buffer,start,find_token(buffer,start,end,4),dtype=numpy.int64)
+        if len(counts) != 4:
+            raise ValueError(f"Invalid result file: {str(filepath)!r}")
+        n_node,n_elem,nn_component,ne_component = counts
+        pos = find_token(buffer,start,end,4+nn_component)
+        nn_dof = parse_numbers(buffer,start,pos,dtype=numpy.int64)[4:]
+        node_labels,pos = read_result_labels(buffer,pos,end,nn_component)
+        node_end = find_token(buffer,pos,end,n_node*(1+nn_dof.sum())+ne_component)
+        values = parse_numbers(buffer,pos,node_end)
+        # Node values followed by the element dofs
+        if node_labels is None or len(values) != n_node*(1+nn_dof.sum())+ne_component:
+            raise ValueError(f"Invalid result file: {str(filepath)!r}")
+        node_ids,node_values = split_result_values(values,n_node,nn_dof,node_labels)
+        elem_ids,elem_values = numpy.zeros(0,dtype=numpy.int64),{}
+        if ne_component > 0:
+            ne_dof = values[n_node*(1+nn_dof.sum()):].astype(numpy.int64)
+            elem_labels,pos = read_result_labels(buffer,node_end,end,ne_component)
+            if elem_labels is None:
+                raise ValueError(f"Invalid result file: {str(filepath)!r}")
+            values = parse_numbers(buffer,pos,end)
+            elem_ids,elem_values = split_result_values(values,n_elem,ne_dof,elem_labels)
+    return node_ids,node_values,elem_ids,elem_values
+
+def split_result_values(values,n,dofs,labels):
+    # values = [id, v_1, ..., v_ndof] * n
+    width = 1+int(numpy.sum(dofs))
+    table = values[:n*width].reshape(n,width)
+    ret = {}
+    column = 1
+    for label,dof in zip(labels,dofs):
+        ret[label] = numpy.ascontiguousarray(table[:,column] if dof == 1 else table[:,column:column+dof])
+        column += dof
+    return table[:,0].astype(numpy.int64),ret
+
+
+class FistrData(VtuData):
+    # VtuData built from FrontISTR native mesh (.msh) and text result (.res) files
+    def clear(self):
+        super().clear()
+        self.mesh_ = None
+        return self
+    def read(self,filepath,mesh_filepath=None,mesh=None,roi_bounds=None):
+        filepath = pathlib.Path(filepath)
+        if filepath.suffix == ".msh":
+            mesh_filepath = filepath
+        elif not mesh_filepath and mesh is None:
+            mesh_filepath = find_mesh_file(filepath)
+        self.mesh_ = mesh if mesh is not None else FistrMesh(mesh_filepath)
+        self.ugrid_ = self.mesh_.to_ugrid()
+        if filepath.suffix != ".msh":
+            self.read_results(find_rank_files(filepath))
+        if roi_bounds is not None:
+            self.ugrid_ = self.extract_cells_in_box(roi_bounds).ugrid_
+        return self
+    def read_results(self,filepaths):
+        # Read per-rank result files in parallel and scatter them onto the global mesh
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=min(len(filepaths),os.cpu_count() or 1)) as executor:
+            results = list(executor.map(read_result_file,filepaths))
+        for index_func,size,data,ids_pos,values_pos in [
+            (self.mesh_.node_index,len(self.mesh_.node_ids_),self.ugrid_.GetPointData(),0,1),
+            (self.mesh_.elem_index,len(self.mesh_.elem_ids_),self.ugrid_.GetCellData(),2,3),
+        ]:
+            arrays = {}
+            for result in results:
+                index = index_func(result[ids_pos])
+                found = index >= 0
+                for label,values in result[values_pos].items():
+                    if label not in arrays:
+                        arrays[label] = numpy.zeros((size,)+values.shape[1:])
+                    arrays[label][index[found]] = values[found]
+            for label,values in arrays.items():
+                array = numpy_to_vtk(values,deep=True)
+                array.SetName(label)
+                data.AddArray(array)
@@ -8,6 +8,10 @@ import vtk
 from vtk.util.numpy_support import vtk_to_numpy
 
 
+ORIGINAL_CELL_IDS = "vtkOriginalCellIds"
+ORIGINAL_POINT_IDS = "vtkOriginalPointIds"
+
+
 class VtuData:
     def __init__(self,filepath=None):
         self.clear()
@@ -15,43 +19,83 @@ class VtuData:
             self.read(filepath)
     def clear(self):
         self.ugrid_ = None
+        self.roi_pieces_ = None
+        self.roi_sources_ = None
         return self
-    def read(self,filepath):
+    def read(self,filepath,roi_bounds=None,roi_pieces=None,roi_sources=None):
         filepath = pathlib.Path(filepath)
         if filepath.suffix == ".vtu":
             reader = vtk.vtkXMLUnstructuredGridReader()
             reader.SetFileName(filepath)
             reader.Update()
             self.ugrid_ = reader.GetOutput()
+        elif filepath.suffix == ".pvtu" and roi_bounds is not None:
+            self.ugrid_ = self.merge_pieces(self.read_pieces_in_box(filepath,roi_bounds,roi_pieces,roi_sources))
         elif filepath.suffix == ".pvtu":
             reader = vtk.vtkXMLPUnstructuredGridReader()
             reader.SetFileName(filepath)
             reader.Update()
-            if reader.GetOutput().GetPointData().GetArray("GlobalPointIds") is not None:
-                # Merge points based on "GlobalPointIds"
-                filter = vtk.vtkStaticCleanUnstructuredGrid()
-                filter.SetInputData(reader.GetOutput())
-                filter.SetMergingArray("GlobalPointIds")
-                filter.Update()
-                # Merge duplicate cells
-                filter2 = vtk.vtkCleanUnstructuredGridCells()
-                filter2.SetInputData(filter.GetOutput())
-                filter2.Update()
-                self.ugrid_ = filter2.GetOutput()
-            elif False:
-                # Merge geometrically coincident points
-                filter = vtk.vtkCleanUnstructuredGrid()
-                filter.SetInputData(reader.GetOutput())
-                filter.Update()
-                # Merge duplicate cells
-                filter2 = vtk.vtkCleanUnstructuredGridCells()
-                filter2.SetInputData(filter.GetOutput())
-                filter2.Update()
-                self.ugrid_ = filter2.GetOutput()
-            else:
-                self.ugrid_ = reader.GetOutput()
+            self.ugrid_ = self.merge_pieces(reader.GetOutput())
         else:
             raise ValueError(f"Invalid file extension: {filepath.suffix}")
+        if roi_bounds is not None:
+            self.ugrid_ = self.extract_cells_in_box(roi_bounds).ugrid_
+        return self
+    def merge_pieces(self,ugrid):
+        if ugrid.GetPointData().GetArray("GlobalPointIds") is not None:
+            # Merge points based on "GlobalPointIds"
+            filter = vtk.vtkStaticCleanUnstructuredGrid()
+            filter.SetInputData(ugrid)
+            filter.SetMergingArray("GlobalPointIds")
+            filter.Update()
+            # Merge duplicate cells
+            filter2 = vtk.vtkCleanUnstructuredGridCells()
+            filter2.SetInputData(filter.GetOutput())
+            filter2.Update()
+            return filter2.GetOutput()
+        elif False:
+            # Merge geometrically coincident points
+            filter = vtk.vtkCleanUnstructuredGrid()
+            filter.SetInputData(ugrid)
+            filter.Update()
+            # Merge duplicate cells
+            filter2 = vtk.vtkCleanUnstructuredGridCells()
+            filter2.SetInputData(filter.GetOutput())
+            filter2.Update()
+            return filter2.GetOutput()
+        else:
+            return ugrid
+    def read_pieces_in_box(self,filepath,roi_bounds,roi_pieces=None,roi_sources=None):
+        # Read only the pieces of a .pvtu file whose bounds intersect the box.
+        # roi_pieces (list of bool per piece) can be given to reuse the selection of a
+        # previous frame; it is only reused when that frame had the same piece sources
+        # (roi_sources), since a repartitioned frame needs a new bounds test. The selection
+        # made here is kept in self.roi_pieces_ and self.roi_sources_.
+        import xml.etree.ElementTree as ET
+        sources = [piece.get("Source") for piece in ET.parse(filepath).getroot().iter("Piece")]
+        pieces = [filepath.parent/source for source in sources]
+        if roi_sources != sources:
+            roi_pieces = None
+        appendFilter = vtk.vtkAppendFilter()
+        self.roi_pieces_ = []
+        self.roi_sources_ = sources
+        for i,piece in enumerate(pieces):
+            if roi_pieces is not None:
+                selected = i < len(roi_pieces) and roi_pieces[i]
+            else:
+                selected = piece_may_intersect_box(piece,roi_bounds)
+            if selected:
+                reader = vtk.vtkXMLUnstructuredGridReader()
+                reader.SetFileName(piece)
+                reader.Update()
+                selected = roi_pieces is not None or boxes_intersect(reader.GetOutput().GetBounds(),roi_bounds)
+                if selected:
+                    appendFilter.AddInputData(reader.GetOutput())
+            self.roi_pieces_.append(bool(selected))
+        if appendFilter.GetNumberOfInputConnections(0) == 0:
+            return vtk.vtkUnstructuredGrid()
+        appendFilter.Update()
+        return appendFilter.GetOutput()
     def npoints(self):
         return self.ugrid_.GetNumberOfPoints()
     def ncells(self):
@@ -117,10 +161,56 @@ class VtuData:
         filter.SetInputData(self.ugrid_)
         filter.Update()
         return vtk_to_numpy(filter.GetOutput().GetCellData().GetArray("Volume"))
+    def calc_cell_sizes(self):
+        # Measure of each cell in its own dimension: volume (3D), area (2D) or length (1D)
+        filter = vtk.vtkCellSizeFilter()
+        filter.SetInputData(self.ugrid_)
+        filter.Update()
+        celldata = filter.GetOutput().GetCellData()
+        # vtkCellSizeFilter sets the arrays of the other dimensions to 0
+        return sum(numpy.abs(vtk_to_numpy(celldata.GetArray(name))) for name in ["Length","Area","Volume"])
+    def extract_cells_in_box(self,bounds,chunksize=1<<20):
+        # Keep the cells whose bounding box intersects the given box
+        ret = VtuData()
+        ret.ugrid_ = vtk.vtkUnstructuredGrid()
+        if self.ncells() == 0:
+            return ret
+        x_min,x_max,y_min,y_max,z_min,z_max = bounds
+        connectivity = self.cells_connectivity()
+        offsets = self.cells_offsets()
+        points = self.points()
+        # Cell bounding boxes in chunks of cells to bound temporaries
+        mask = numpy.empty(self.ncells(),dtype=bool)
+        for start in range(0,self.ncells(),chunksize):
+            chunk_offsets = offsets[start:start+chunksize+1]
+            cell_points = points[connectivity[chunk_offsets[0]:chunk_offsets[-1]]]
+            cell_min = numpy.minimum.reduceat(cell_points,chunk_offsets[:-1]-chunk_offsets[0],axis=0)
+            cell_max = numpy.maximum.reduceat(cell_points,chunk_offsets[:-1]-chunk_offsets[0],axis=0)
+            mask[start:start+len(cell_min)] = numpy.all((cell_max >= (x_min,y_min,z_min)) & (cell_min <= (x_max,y_max,z_max)),axis=1)
+        if mask.all():
+            ret.ugrid_ = self.ugrid_
+            return ret
+        if not mask.any():
+            return ret
+        filter = vtk.vtkExtractCells()
+        filter.SetInputData(self.ugrid_)
+        cell_ids = numpy.flatnonzero(mask)
+        filter.SetCellIds(cell_ids,len(cell_ids))
+        filter.Update()
+        ret.ugrid_ = filter.GetOutput()
+        # Avoid confusion with the IDs passed through by extract_surface
+        ret.ugrid_.GetCellData().RemoveArray(ORIGINAL_CELL_IDS)
+        ret.ugrid_.GetPointData().RemoveArray(ORIGINAL_POINT_IDS)
+        return ret
     def extract_surface(self):
         # Issue: vtkGeometryFilter does not preserve face shape for quadratic elements
+        # The surface keeps the IDs of the original cells/points (ORIGINAL_CELL_IDS, ORIGINAL_POINT_IDS)
         geometryFilter = vtk.vtkGeometryFilter()
         geometryFilter.SetInputData(self.ugrid_)
+        geometryFilter.PassThroughCellIdsOn()
+        geometryFilter.PassThroughPointIdsOn()
+        geometryFilter.SetOriginalCellIdsName(ORIGINAL_CELL_IDS)
+        geometryFilter.SetOriginalPointIdsName(ORIGINAL_POINT_IDS)
         geometryFilter.Update()
         appendFilter = vtk.vtkAppendFilter()
         appendFilter.AddInputData(geometryFilter.GetOutput())
@@ -130,9 +220,239 @@ class VtuData:
         return ret
 
 
+class CellDataMapping:
+    # Mapping from the cells of a volume to the faces and points of its surface.
+    # Built once per topology; mapping a cell array then only costs a gather (faces)
+    # or a size-weighted scatter with numpy.bincount (points).
+    def __init__(self,vtu,vtu_surface,cell_to_point=False):
+        self.face_cells_ = vtu_surface.cell_attribute_array(ORIGINAL_CELL_IDS).astype(numpy.int64)
+        self.surface_points_ = vtu_surface.point_attribute_array(ORIGINAL_POINT_IDS).astype(numpy.int64)
+        self.npoints_ = len(self.surface_points_)
+        self.scatter_points_ = None
+        if cell_to_point:
+            # (surface point, cell, weight) for every cell node that lies on the surface
+            connectivity = vtu.cells_connectivity()
+            offsets = vtu.cells_offsets()
+            cells = numpy.repeat(numpy.arange(len(offsets)-1),numpy.diff(offsets))
+            surface_index = numpy.full(vtu.npoints(),-1,dtype=numpy.int64)
+            surface_index[self.surface_points_] = numpy.arange(self.npoints_)
+            points = surface_index[connectivity]
+            on_surface = points >= 0
+            self.scatter_points_ = points[on_surface]
+            self.scatter_cells_ = cells[on_surface]
+            self.scatter_weights_ = vtu.calc_cell_sizes()[self.scatter_cells_]
+            self.weight_sum_ = numpy.bincount(self.scatter_points_,weights=self.scatter_weights_,minlength=self.npoints_)
+            # Points whose cells are all degenerate (zero size) fall back to a plain average
+            degenerate = numpy.flatnonzero(self.weight_sum_ == 0)
+            if len(degenerate) > 0:
+                fallback = numpy.isin(self.scatter_points_,degenerate)
+                self.scatter_weights_[fallback] = 1.0
+                self.weight_sum_[degenerate] = numpy.bincount(self.scatter_points_[fallback],minlength=self.npoints_)[degenerate]
+    def points(self,point_values):
+        # Point array of the volume -> surface points
+        return point_values[self.surface_points_]
+    def faces(self,cell_values):
+        # Cell array of the volume -> surface faces
+        return cell_values[self.face_cells_]
+    def cell_to_point(self,cell_values):
+        # Cell array of the volume -> surface points (average weighted by cell volume/area/length)
+        cell_values = numpy.asarray(cell_values,dtype=numpy.float64)
+        values = cell_values.reshape(len(cell_values),-1)[self.scatter_cells_]*self.scatter_weights_[:,None]
+        ret = numpy.stack([numpy.bincount(self.scatter_points_,weights=values[:,k],minlength=self.npoints_) for k in range(values.shape[1])],axis=1)
+        ret = numpy.divide(ret,self.weight_sum_[:,None],out=numpy.zeros_like(ret),where=self.weight_sum_[:,None] > 0)
+        return ret.reshape((self.npoints_,)+cell_values.shape[1:])
+
+
+def selected_cell_arrays(vtu,names):
+    # Comma separated names, or "*" for all the cell arrays
+    available = [name for name in vtu.cell_attributes() if not name.startswith("vtk")]
+    if names.strip() == "*":
+        return available,[]
+    selected = [name.strip() for name in names.split(",") if name.strip()]
+    return [name for name in selected if name in available],[name for name in selected if name not in available]
+
+def set_mesh_attribute(mesh,name,values,domain):
+    # 1 component -> FLOAT/INT, 3 components -> FLOAT_VECTOR, otherwise one FLOAT attribute per component
+    if values.ndim == 1:
+        if numpy.issubdtype(values.dtype,numpy.integer):
+            mesh.attributes.new(name=name,type='INT',domain=domain)
+            mesh.attributes[name].data.foreach_set("value",values.astype(numpy.int32))
+        else:
+            mesh.attributes.new(name=name,type='FLOAT',domain=domain)
+            mesh.attributes[name].data.foreach_set("value",values.astype(numpy.float32))
+    elif values.shape[1] == 3:
+        mesh.attributes.new(name=name,type='FLOAT_VECTOR',domain=domain)
+        mesh.attributes[name].data.foreach_set("vector",values.astype(numpy.float32).ravel())
+    else:
+        for k in range(values.shape[1]):
+            set_mesh_attribute(mesh,f"{name}[{k}]",numpy.ascontiguousarray(values[:,k]),domain)
+
+
+def boxes_intersect(bounds1,bounds2):
+    # bounds are given as (x_min,x_max,y_min,y_max,z_min,z_max)
+    return all(bounds1[2*i] <= bounds2[2*i+1] and bounds2[2*i] <= bounds1[2*i+1] for i in range(3))
+
+def piece_may_intersect_box(filepath,bounds,chunksize=65536,max_header_size=1<<20):
+    # Cheap test on the header of a .vtu piece, without decoding its data.
+    # Only the RangeMin/RangeMax (range of |x|) of the "Points" array can be used; a
+    # piece whose points all lie outside the box's distance range from the origin is
+    # rejected. Returns True whenever the header does not allow a decision.
+    import re
+    header = b""
+    match = None
+    with open(filepath,"rb") as f:
+        while len(header) < max_header_size:
+            chunk = f.read(chunksize)
+            if not chunk:
+                break
+            header += chunk
+            match = re.search(rb"<Points>\s*<DataArray([^>]*)>",header)
+            if match or b"<AppendedData" in header:
+                break
+    if not match:
+        return True
+    range_min = re.search(rb'RangeMin="([^"]*)"',match.group(1))
+    range_max = re.search(rb'RangeMax="([^"]*)"',match.group(1))
+    if not range_min or not range_max:
+        return True
+    corners = numpy.array(bounds).reshape(3,2)
+    nearest = numpy.clip(0.0,corners[:,0],corners[:,1])
+    farthest = numpy.where(numpy.abs(corners[:,0]) > numpy.abs(corners[:,1]),corners[:,0],corners[:,1])
+    return numpy.linalg.norm(nearest) <= float(range_max.group(1)) and numpy.linalg.norm(farthest) >= float(range_min.group(1))
+
+
+class FieldStatistics:
+    # Single-pass statistics of a scalar field over a sequence of frames.
+    # The global histogram has a fixed number of bins; when a new frame falls outside
+    # its range, the bin width is doubled and adjacent bins are merged, so memory does
+    # not depend on the number of frames. Each frame also gets its own histogram, of
+    # which only the percentiles are kept.
+    def __init__(self,nbins=1024,per_frame=True):
+        self.nbins_ = nbins + nbins%2
+        self.per_frame_ = per_frame
+        self.clear()
+    def clear(self):
+        self.count_ = 0
+        self.sum_ = 0.0
+        self.min_ = None
+        self.max_ = None
+        self.hist_lo_ = None
+        self.hist_width_ = None
+        self.hist_ = numpy.zeros(self.nbins_,dtype=numpy.int64)
+        self.frame_min_ = []
+        self.frame_max_ = []
+        self.frame_mean_ = []
+        self.frame_p01_ = []
+        self.frame_p99_ = []
+        return self
+    def nframes(self):
+        return len(self.frame_min_)
+    def hist_hi(self):
+        return self.hist_lo_+self.nbins_*self.hist_width_
+    def grow_histogram(self,value_min,value_max):
+        if self.hist_lo_ is None:
+            width = (value_max-value_min)/(self.nbins_-1)
+            if not width > 0.0:
+                width = max(abs(value_min),1.0)*1e-6
+            self.hist_lo_ = value_min
+            self.hist_width_ = width
+        while value_min < self.hist_lo_ or value_max >= self.hist_hi():
+            merged = self.hist_.reshape(-1,2).sum(axis=1)
+            padding = numpy.zeros(self.nbins_//2,dtype=numpy.int64)
+            if value_min < self.hist_lo_:
+                # extend downward
+                self.hist_ = numpy.concatenate([padding,merged])
+                self.hist_lo_ -= self.nbins_*self.hist_width_
+            else:
+                # extend upward
+                self.hist_ = numpy.concatenate([merged,padding])
+            self.hist_width_ *= 2.0
+    def add(self,values):
+        values = numpy.asarray(values,dtype=numpy.float64).ravel()
+        values = values[numpy.isfinite(values)]
+        if values.size == 0:
+            self.frame_min_.append(numpy.nan)
+            self.frame_max_.append(numpy.nan)
+            self.frame_mean_.append(numpy.nan)
+            self.frame_p01_.append(numpy.nan)
+            self.frame_p99_.append(numpy.nan)
+            return self
+        value_min = float(values.min())
+        value_max = float(values.max())
+        value_sum = float(values.sum())
+        self.frame_min_.append(value_min)
+        self.frame_max_.append(value_max)
+        self.frame_mean_.append(value_sum/values.size)
+        if self.per_frame_:
+            frame = FieldStatistics(self.nbins_,per_frame=False).add(values)
+            self.frame_p01_.append(frame.percentile(1.0))
+            self.frame_p99_.append(frame.percentile(99.0))
+        self.count_ += values.size
+        self.sum_ += value_sum
+        self.min_ = value_min if self.min_ is None else min(self.min_,value_min)
+        self.max_ = value_max if self.max_ is None else max(self.max_,value_max)
+        self.grow_histogram(value_min,value_max)
+        index = ((values-self.hist_lo_)/self.hist_width_).astype(numpy.int64)
+        numpy.clip(index,0,self.nbins_-1,out=index)
+        self.hist_ += numpy.bincount(index,minlength=self.nbins_)
+        return self
+    def min(self):
+        return self.min_
+    def max(self):
+        return self.max_
+    def mean(self):
+        if self.count_ == 0:
+            return None
+        return self.sum_/self.count_
+    def histogram(self):
+        edges = self.hist_lo_+self.hist_width_*numpy.arange(self.nbins_+1) if self.count_ else None
+        return self.hist_,edges
+    def percentile(self,q):
+        # Approximate percentile (0 <= q <= 100) interpolated linearly within a bin
+        if self.count_ == 0:
+            return None
+        cumsum = numpy.cumsum(self.hist_)
+        target = q/100.0*self.count_
+        i = int(numpy.searchsorted(cumsum,target,side="left"))
+        i = min(i,self.nbins_-1)
+        below = cumsum[i-1] if i > 0 else 0
+        fraction = (target-below)/self.hist_[i] if self.hist_[i] > 0 else 0.0
+        value = self.hist_lo_+(i+fraction)*self.hist_width_
+        return min(max(value,self.min_),self.max_)
+    def color_range(self,mode="MINMAX",percentile_min=1.0,percentile_max=99.0):
+        if self.count_ == 0:
+            return 0.0,0.0
+        if mode == "PERCENTILE":
+            # Lower/upper given in reverse order
+            percentile_min,percentile_max = sorted([percentile_min,percentile_max])
+            return self.percentile(percentile_min),self.percentile(percentile_max)
+        return self.min_,self.max_
+    def store(self,idblock,prefix):
+        # Store the statistics as custom properties of a Blender ID (e.g. object)
+        if self.count_ == 0:
+            return
+        idblock[f"{prefix}/min"] = self.min_
+        idblock[f"{prefix}/max"] = self.max_
+        idblock[f"{prefix}/mean"] = self.mean()
+        idblock[f"{prefix}/p01"] = self.percentile(1.0)
+        idblock[f"{prefix}/p99"] = self.percentile(99.0)
+        if self.nframes() > 1:
+            idblock[f"{prefix}/frame_min"] = self.frame_min_
+            idblock[f"{prefix}/frame_max"] = self.frame_max_
+            idblock[f"{prefix}/frame_mean"] = self.frame_mean_
+            if self.per_frame_:
+                idblock[f"{prefix}/frame_p01"] = self.frame_p01_
+                idblock[f"{prefix}/frame_p99"] = self.frame_p99_
+
+
 ATTRIBUTE_NAME_DISPLACEMENT = "DISPLACEMENT"
 ATTRIBUTE_NAME_MISES_STRESS = "NodalMISES"
 
+COLOR_RANGE_MODES = [
+    ("MINMAX", "Min/Max", "Map the full range of values to the color ramp"),
+    ("PERCENTILE", "Percentile", "Map an approximate percentile range to the color ramp (robust to hot spots)"),
+]
+
 
 def clear_existing_objects():
     bpy.ops.wm.read_factory_settings(use_empty=True)
@@ -160,18 +480,76 @@ def new_material_nodes(context, obj, material_name):
     obj.data.materials.append(material)
     return material,material.node_tree
 
+def read_data(filepath, roi_bounds=None, roi_pieces=None, roi_sources=None, mesh_filepath=None, mesh=None):
+    # .vtu/.pvtu files are read by VTK, FrontISTR native .msh/.res files by FistrData
+    from .import_fistr import FistrData, is_fistr_file
+    if is_fistr_file(filepath):
+        if mesh_filepath:
+            mesh_filepath = bpy.path.abspath(mesh_filepath)
+        return FistrData().read(filepath, mesh_filepath=mesh_filepath, mesh=mesh, roi_bounds=roi_bounds)
+    return VtuData().read(filepath, roi_bounds=roi_bounds, roi_pieces=roi_pieces, roi_sources=roi_sources)
+
+def unique_result_files(filepaths):
+    # Keep one file per step of distributed FrontISTR results (the other ranks are found by the reader)
+    from .import_fistr import is_fistr_file, result_group_key
+    ret = []
+    keys = set()
+    for filepath in filepaths:
+        key = result_group_key(filepath) if is_fistr_file(filepath) else filepath
+        if key not in keys:
+            keys.add(key)
+            ret.append(filepath)
+    return ret
+
+def get_roi_bounds(self, context):
+    # Axis-aligned region of interest (x_min,x_max,y_min,y_max,z_min,z_max) from the operator properties
+    if not self.use_roi:
+        return None
+    if self.roi_object:
+        import itertools
+        import mathutils
+        obj = bpy.data.objects.get(self.roi_object)
+        if obj is None:
+            raise ValueError(f"ROI object not found: {self.roi_object!r}")
+        if obj.type == 'EMPTY':
+            size = obj.empty_display_size
+            corners = list(itertools.product((-size,size),repeat=3))
+        else:
+            corners = [tuple(corner) for corner in obj.bound_box]
+        corners = numpy.array([tuple(obj.matrix_world @ mathutils.Vector(corner)) for corner in corners])
+    else:
+        corners = numpy.array([tuple(self.roi_min),tuple(self.roi_max)])
+    lo = corners.min(axis=0)
+    hi = corners.max(axis=0)
+    return (lo[0],hi[0],lo[1],hi[1],lo[2],hi[2])
+
+def search_objects(self, context, edit_text):
+    return [obj.name for obj in bpy.data.objects if edit_text.lower() in obj.name.lower()]
+
 def fistr_import_vtu(self, context):
     import time as timer
     new_objects = []
-    for file in self.files:
+    try:
+        roi_bounds = get_roi_bounds(self, context)
+    except ValueError as e:
+        self.report({'ERROR'}, str(e))
+        return {'CANCELLED'}
+    filepaths = unique_result_files([os.path.join(self.directory, file.name) for file in self.files])
+    for filepath in filepaths:
         t0 = timer.perf_counter()
-        filepath = os.path.join(self.directory, file.name)
         objname = bpy.path.display_name_from_filepath(filepath)
         objname = objname.replace(".","_")
         print(f"objname = {objname}")
         
         # load vtu file and extract surface
-        vtu = VtuData(filepath)
+        try:
+            vtu = read_data(filepath, roi_bounds=roi_bounds, mesh_filepath=self.mesh_filepath)
+        except ValueError as e:
+            self.report({'ERROR'}, str(e))
+            continue
+        if vtu.ncells() == 0:
+            self.report({'WARNING'}, f"No cells in the region of interest: {filepath!r}")
+            continue
         vtu_surface = vtu.extract_surface()
         npoints = vtu_surface.npoints()
         ncells = vtu_surface.ncells()
@@ -180,6 +558,9 @@ def fistr_import_vtu(self, context):
         offsets = vtu_surface.cells_offsets()
         attr_displacement = vtu_surface.point_attribute_array(ATTRIBUTE_NAME_DISPLACEMENT)
         attr_mises_stress = vtu_surface.point_attribute_array(ATTRIBUTE_NAME_MISES_STRESS)
+        cell_arrays,missing = selected_cell_arrays(vtu, self.cell_arrays)
+        if missing:
+            self.report({'WARNING'}, f"Cell arrays not found: {', '.join(missing)}")
         
         # Create mesh
         mesh_verts = vtu_surface.points()
@@ -195,18 +576,28 @@ def fistr_import_vtu(self, context):
         # Set object properties
         obj.location = (0,0,0)
         obj.scale = (1,1,1)
+        obj["fistr_filepath"] = filepath
+        if self.mesh_filepath:
+            obj["fistr_mesh_filepath"] = bpy.path.abspath(self.mesh_filepath)
         
         # Set object attributes
-        mises_stress_min = 0.0
-        mises_stress_max = 0.0
+        mises_stress_stats = FieldStatistics()
         if attr_displacement is not None:
             obj.data.attributes.new(name=ATTRIBUTE_NAME_DISPLACEMENT,type='FLOAT_VECTOR',domain='POINT')
             obj.data.attributes[ATTRIBUTE_NAME_DISPLACEMENT].data.foreach_set("vector", attr_displacement.flatten())
         if attr_mises_stress is not None:
             obj.data.attributes.new(name=ATTRIBUTE_NAME_MISES_STRESS,type='FLOAT',domain='POINT')
             obj.data.attributes[ATTRIBUTE_NAME_MISES_STRESS].data.foreach_set("value", attr_mises_stress)
-            mises_stress_min = min(mises_stress_min,attr_mises_stress.min())
-            mises_stress_max = max(mises_stress_max,attr_mises_stress.max())
+            mises_stress_stats.add(attr_mises_stress)
+        if cell_arrays:
+            mapping = CellDataMapping(vtu, vtu_surface, cell_to_point=self.cell_to_point)
+            for name in cell_arrays:
+                values = vtu.cell_attribute_array(name)
+                set_mesh_attribute(obj.data, name, mapping.faces(values), 'FACE')
+                if self.cell_to_point:
+                    set_mesh_attribute(obj.data, f"{name}_point", mapping.cell_to_point(values), 'POINT')
+        mises_stress_stats.store(obj, ATTRIBUTE_NAME_MISES_STRESS)
+        mises_stress_min,mises_stress_max = mises_stress_stats.color_range(self.color_range_mode,self.color_percentile_min,self.color_percentile_max)
         
         # Create material for surface
         material1,matnodes1 = new_material_nodes(context, obj, f"{objname}.material")
@@ -403,16 +794,26 @@ class FISTR_ImportVtu(bpy.types.Operator, bpy_extras.io_utils.ImportHelper):
     bl_label = "Import VTU files"
     bl_options = {'REGISTER','UNDO'}
 
-    filter_glob: bpy.props.StringProperty(default="*.vtu;*.pvtu", options={'HIDDEN'})
+    filter_glob: bpy.props.StringProperty(default="*.vtu;*.pvtu;*.msh;*.res*", options={'HIDDEN'})
     directory: bpy.props.StringProperty(subtype='DIR_PATH')
     files: bpy.props.CollectionProperty(type=bpy.types.OperatorFileListElement, options={'HIDDEN','SKIP_SAVE'})
+    color_range_mode: bpy.props.EnumProperty(name="Color Range", items=COLOR_RANGE_MODES, default="MINMAX")
+    color_percentile_min: bpy.props.FloatProperty(name="Lower Percentile", default=1.0, min=0.0, max=100.0)
+    color_percentile_max: bpy.props.FloatProperty(name="Upper Percentile", default=99.0, min=0.0, max=100.0)
+    use_roi: bpy.props.BoolProperty(name="Region of Interest", description="Import only the cells intersecting an axis-aligned box", default=False)
+    roi_object: bpy.props.StringProperty(name="ROI Object", description="Object whose bounding box defines the region (overrides ROI Min/Max)", search=search_objects)
+    roi_min: bpy.props.FloatVectorProperty(name="ROI Min", subtype='XYZ', default=(0.0,0.0,0.0))
+    roi_max: bpy.props.FloatVectorProperty(name="ROI Max", subtype='XYZ', default=(1.0,1.0,1.0))
+    mesh_filepath: bpy.props.StringProperty(name="Mesh File", description="FrontISTR mesh (.msh) for .res files (found from hecmw_ctrl.dat or the directory if empty)", subtype='FILE_PATH')
+    cell_arrays: bpy.props.StringProperty(name="Cell Arrays", description="Comma-separated names of cell arrays to import on faces (e.g. ElementalSTRESS), or * for all", default="")
+    cell_to_point: bpy.props.BoolProperty(name="Cell to Point", description="Also import the cell arrays averaged onto points (weighted by cell volume, area or length) as <name>_point", default=False)
 
     def execute(self, context):
         return fistr_import_vtu(self, context)
 
 
 def menu_func_import(self, context):
-    self.layout.operator(FISTR_ImportVtu.bl_idname, text="FrontISTR VTU (.vtu|.pvtu)")
+    self.layout.operator(FISTR_ImportVtu.bl_idname, text="FrontISTR VTU (.vtu|.pvtu|.msh|.res)")
 
 def register():
 	bpy.utils.register_class(FISTR_ImportVtu)
@@ -8,19 +8,79 @@ import vtk
 from vtk.util.numpy_support import vtk_to_numpy
 
 from .import_vtu import (
-    VtuData,
+    FieldStatistics,
+    CellDataMapping,
     ATTRIBUTE_NAME_DISPLACEMENT,
     ATTRIBUTE_NAME_MISES_STRESS,
+    COLOR_RANGE_MODES,
+    get_roi_bounds,
+    selected_cell_arrays,
+    set_mesh_attribute,
+    read_data,
+    unique_result_files,
+    search_objects,
     new_geometry_nodes,
     new_material_nodes
 )
 
 
+def topology_key(vtu):
+    # Hash of the connectivity; frames with the same key share one mesh
+    import hashlib
+    h = hashlib.blake2b(digest_size=16)
+    h.update(numpy.int64(vtu.npoints()).tobytes())
+    h.update(numpy.ascontiguousarray(vtu.cells_offsets()).tobytes())
+    h.update(numpy.ascontiguousarray(vtu.cells_connectivity()).tobytes())
+    return h.hexdigest()
+
+def new_surface_object(context, vtu_surface, objname):
+    ncells = vtu_surface.ncells()
+    connectivity = vtu_surface.cells_connectivity()
+    offsets = vtu_surface.cells_offsets()
+    
+    # Create mesh
+    mesh_verts = vtu_surface.points()
+    mesh_faces = [tuple(connectivity[offsets[i]:offsets[i+1]]) for i in range(ncells)]
+    mesh = bpy.data.meshes.new(name=f"{objname}.mesh")
+    mesh.from_pydata(mesh_verts,[],mesh_faces)
+    mesh.update()
+    
+    # Create object
+    obj = bpy_extras.object_utils.object_data_add(context, mesh, name=f"{objname}")
+    
+    # Set object properties
+    obj.location = (0,0,0)
+    obj.scale = (1,1,1)
+    return obj
+
+def set_frame_visibility(frame_objects, frame_start):
+    # Keyframe the visibility so that only the object of the current frame's topology is shown
+    for obj in set(frame_objects):
+        visible_prev = None
+        for i,frame_obj in enumerate(frame_objects):
+            visible = frame_obj is obj
+            if visible != visible_prev:
+                obj.hide_viewport = not visible
+                obj.hide_render = not visible
+                obj.keyframe_insert("hide_viewport", frame=frame_start+i)
+                obj.keyframe_insert("hide_render", frame=frame_start+i)
+                visible_prev = visible
+        # Restore the state of the first frame
+        obj.hide_viewport = frame_objects[0] is not obj
+        obj.hide_render = frame_objects[0] is not obj
+
+def frame_warning_message(i, filepath, warnings):
+    message = ""
+    message += f"filepaths[{i}] = {filepath!r}\\n"
+    for warning in warnings:
+        message += f"  - {warning}\\n"
+    return message
+
 def fistr_import_vtu_sequence(self, context):
     import time as timer
     t0 = timer.perf_counter()
     
-    filepaths = [os.path.join(self.directory, file.name) for file in self.files]
+    filepaths = unique_result_files([os.path.join(self.directory, file.name) for file in self.files])
     nfiles = len(filepaths)
     if nfiles == 0:
         self.report({'ERROR'}, "No files selected")
@@ -33,37 +93,64 @@ def fistr_import_vtu_sequence(self, context):
     objname = objname.replace(".","_")+f"_{nfiles}"
     print(f"objname = {objname}")
     
+    try:
+        roi_bounds = get_roi_bounds(self, context)
+    except ValueError as e:
+        self.report({'ERROR'}, str(e))
+        return {'CANCELLED'}
+    
     # load vtu file and extract surface
-    vtu = VtuData(filepaths[0])
-    vtu_surface = vtu.extract_surface()
-    npoints = vtu_surface.npoints()
-    ncells = vtu_surface.ncells()
+    try:
+        vtu = read_data(filepaths[0], roi_bounds=roi_bounds, mesh_filepath=self.mesh_filepath)
+    except ValueError as e:
+        self.report({'ERROR'}, str(e))
+        return {'CANCELLED'}
+    if vtu.ncells() == 0:
+        self.report({'ERROR'}, "No cells in the region of interest")
+        return {'CANCELLED'}
+    # FrontISTR mesh read for the first frame is reused for the others; the pieces selected
+    # for a frame are reused for the next one if its .pvtu lists the same piece sources
+    roi_pieces,roi_sources = vtu.roi_pieces_,vtu.roi_sources_
+    fistr_mesh = getattr(vtu, "mesh_", None)
     cellsize = numpy.cbrt(vtu.calc_cell_volumes().mean())
-    connectivity = vtu_surface.cells_connectivity()
-    offsets = vtu_surface.cells_offsets()
-    
-    # Create mesh
-    mesh_verts = vtu_surface.points()
-    mesh_faces = [tuple(connectivity[offsets[i]:offsets[i+1]]) for i in range(ncells)]
-    mesh = bpy.data.meshes.new(name=f"{objname}.mesh")
-    mesh.from_pydata(mesh_verts,[],mesh_faces)
-    mesh.update()
-    
-    # Create object
-    obj = bpy_extras.object_utils.object_data_add(context, mesh, name=f"{objname}")
-    
-    # Set object properties
-    obj.location = (0,0,0)
-    obj.scale = (1,1,1)
+    cell_arrays,missing = selected_cell_arrays(vtu, self.cell_arrays)
+    if missing:
+        self.report({'WARNING'}, f"Cell arrays not found: {', '.join(missing)}")
     
     # Set object attributes
-    mises_stress_min = 0.0
-    mises_stress_max = 0.0
+    # Frames are grouped by topology; the surface and its mapping from the volume are built
+    # once per distinct topology, the other frames only gather their arrays
+    topology_objects = {}
+    topology_mappings = {}
+    frame_objects = []
+    mises_stress_stats = FieldStatistics()
     for i,filepath in enumerate(filepaths):
         warnings = []
         frame = frame_start+i
-        current_vtu_surface = VtuData(filepaths[i]).extract_surface()
-        attr_displacement = current_vtu_surface.point_attribute_array(ATTRIBUTE_NAME_DISPLACEMENT)
+        try:
+            current_vtu = vtu if i == 0 else read_data(filepaths[i], roi_bounds=roi_bounds, roi_pieces=roi_pieces, roi_sources=roi_sources, mesh=fistr_mesh)
+        except (ValueError,OSError) as e:
+            # Skip the frame; the previous frame's object stays visible
+            warnings.append(str(e))
+            self.report({'WARNING'},frame_warning_message(i,filepath,warnings))
+            frame_objects.append(frame_objects[-1])
+            mises_stress_stats.add(())
+            continue
+        if current_vtu.roi_sources_ is not None:
+            roi_pieces,roi_sources = current_vtu.roi_pieces_,current_vtu.roi_sources_
+        key = topology_key(current_vtu)
+        if key not in topology_objects:
+            current_vtu_surface = current_vtu.extract_surface()
+            name = objname if not topology_objects else f"{objname}_topology{len(topology_objects)}"
+            topology_objects[key] = new_surface_object(context, current_vtu_surface, name)
+            topology_mappings[key] = CellDataMapping(current_vtu, current_vtu_surface, cell_to_point=self.cell_to_point)
+        obj = topology_objects[key]
+        mapping = topology_mappings[key]
+        frame_objects.append(obj)
+        npoints = mapping.npoints_
+        attr_displacement = current_vtu.point_attribute_array(ATTRIBUTE_NAME_DISPLACEMENT)
+        if attr_displacement is not None:
+            attr_displacement = mapping.points(attr_displacement)
         if attr_displacement is None:
             warnings.append("Displacement array not found")
         elif attr_displacement.shape != (npoints,3):
@@ -71,22 +158,37 @@ def fistr_import_vtu_sequence(self, context):
         else:
             obj.data.attributes.new(name=f"{frame}/{ATTRIBUTE_NAME_DISPLACEMENT}",type='FLOAT_VECTOR',domain='POINT')
             obj.data.attributes[f"{frame}/{ATTRIBUTE_NAME_DISPLACEMENT}"].data.foreach_set("vector", attr_displacement.flatten())
-        attr_mises_stress = current_vtu_surface.point_attribute_array(ATTRIBUTE_NAME_MISES_STRESS)
+        attr_mises_stress = current_vtu.point_attribute_array(ATTRIBUTE_NAME_MISES_STRESS)
+        if attr_mises_stress is not None:
+            attr_mises_stress = mapping.points(attr_mises_stress)
         if attr_mises_stress is None:
             warnings.append("Mises stress array not found")
+            # Keep one (NaN) statistics entry per frame
+            mises_stress_stats.add(())
         elif attr_mises_stress.shape != (npoints,):
             warnings.append(f"Mises stress array shape mismatch: {attr_mises_stress.shape} instead of {(npoints,)}")
+            mises_stress_stats.add(())
         else:
             obj.data.attributes.new(name=f"{frame}/{ATTRIBUTE_NAME_MISES_STRESS}",type='FLOAT',domain='POINT')
             obj.data.attributes[f"{frame}/{ATTRIBUTE_NAME_MISES_STRESS}"].data.foreach_set("value", attr_mises_stress)
-            mises_stress_min = min(mises_stress_min,attr_mises_stress.min())
-            mises_stress_max = max(mises_stress_max,attr_mises_stress.max())
+            mises_stress_stats.add(attr_mises_stress)
+        for name in cell_arrays:
+            values = current_vtu.cell_attribute_array(name)
+            if values is None:
+                warnings.append(f"Cell array not found: {name}")
+                continue
+            set_mesh_attribute(obj.data, f"{frame}/{name}", mapping.faces(values), 'FACE')
+            if self.cell_to_point:
+                set_mesh_attribute(obj.data, f"{frame}/{name}_point", mapping.cell_to_point(values), 'POINT')
         if warnings:
-            message = ""
-            message += f"filepaths[{i}] = {filepath!r}\\n"
-            for warning in warnings:
-                message += f"  - {warning}\\n"
-            self.report({'WARNING'},message)
+            self.report({'WARNING'},frame_warning_message(i,filepath,warnings))
+    objects = list(topology_objects.values())
+    obj = objects[0]
+    if len(objects) > 1:
+        print(f"{len(objects)} topologies in {nfiles} frames")
+        set_frame_visibility(frame_objects, frame_start)
+    mises_stress_stats.store(obj, ATTRIBUTE_NAME_MISES_STRESS)
+    mises_stress_min,mises_stress_max = mises_stress_stats.color_range(self.color_range_mode,self.color_percentile_min,self.color_percentile_max)
     
     # Create material for surface
     material1,matnodes1 = new_material_nodes(context, obj, f"{objname}.material")
@@ -267,12 +369,20 @@ def fistr_import_vtu_sequence(self, context):
     node_output.location.y = node_joingeometry.location.y
     geonodes.links.new(node_joingeometry.outputs[0], node_output.inputs[0])
     
+    # Share materials and geometry nodes with the objects of the other topologies
+    for other in objects[1:]:
+        other.data.materials.append(material1)
+        other.data.materials.append(material2)
+        modifier = other.modifiers.new(name=bpy.app.translations.pgettext_data("Geometry Nodes"), type='NODES')
+        modifier.node_group = geonodes
+    
     # finish
     t1 = timer.perf_counter()
     print(f"Successfully imported {nfiles} files in {t1-t0:.3f} sec")
     
-    # Select created object
-    obj.select_set(True)
+    # Select created objects
+    for obj in objects:
+        obj.select_set(True)
     
     return {'FINISHED'}
 
@@ -282,16 +392,26 @@ class FISTR_ImportVtuSquence(bpy.types.Operator, bpy_extras.io_utils.ImportHelpe
     bl_label = "Import VTU files"
     bl_options = {'REGISTER','UNDO'}
 
-    filter_glob: bpy.props.StringProperty(default="*.vtu;*.pvtu", options={'HIDDEN'})
+    filter_glob: bpy.props.StringProperty(default="*.vtu;*.pvtu;*.msh;*.res*", options={'HIDDEN'})
     directory: bpy.props.StringProperty(subtype='DIR_PATH')
     files: bpy.props.CollectionProperty(type=bpy.types.OperatorFileListElement, options={'HIDDEN','SKIP_SAVE'})
+    color_range_mode: bpy.props.EnumProperty(name="Color Range", items=COLOR_RANGE_MODES, default="MINMAX")
+    color_percentile_min: bpy.props.FloatProperty(name="Lower Percentile", default=1.0, min=0.0, max=100.0)
+    color_percentile_max: bpy.props.FloatProperty(name="Upper Percentile", default=99.0, min=0.0, max=100.0)
+    use_roi: bpy.props.BoolProperty(name="Region of Interest", description="Import only the cells intersecting an axis-aligned box", default=False)
+    roi_object: bpy.props.StringProperty(name="ROI Object", description="Object whose bounding box defines the region (overrides ROI Min/Max)", search=search_objects)
+    roi_min: bpy.props.FloatVectorProperty(name="ROI Min", subtype='XYZ', default=(0.0,0.0,0.0))
+    roi_max: bpy.props.FloatVectorProperty(name="ROI Max", subtype='XYZ', default=(1.0,1.0,1.0))
+    mesh_filepath: bpy.props.StringProperty(name="Mesh File", description="FrontISTR mesh (.msh) for .res files (found from hecmw_ctrl.dat or the directory if empty)", subtype='FILE_PATH')
+    cell_arrays: bpy.props.StringProperty(name="Cell Arrays", description="Comma-separated names of cell arrays to import on faces (e.g. ElementalSTRESS), or * for all", default="")
+    cell_to_point: bpy.props.BoolProperty(name="Cell to Point", description="Also import the cell arrays averaged onto points (weighted by cell volume, area or length) as <name>_point", default=False)
 
     def execute(self, context):
         return fistr_import_vtu_sequence(self, context)
 
 
 def menu_func_import(self, context):
-    self.layout.operator(FISTR_ImportVtuSquence.bl_idname, text="FrontISTR VTU sequence (.vtu|.pvtu)")
+    self.layout.operator(FISTR_ImportVtuSquence.bl_idname, text="FrontISTR VTU sequence (.vtu|.pvtu|.msh|.res)")
 
 def register():
 	bpy.utils.register_class(FISTR_ImportVtuSquence)
@@ -0,0 +1,348 @@
+
+import os
+
+import bpy
+import numpy
+import vtk
+
+from .import_vtu import (
+    ATTRIBUTE_NAME_DISPLACEMENT,
+    ATTRIBUTE_NAME_MISES_STRESS,
+    read_data,
+)
+
+
+HEXAHEDRON_TETRAS = [[0,1,2,6],[0,2,3,6],[0,3,7,6],[0,7,4,6],[0,4,5,6],[0,5,1,6]]
+VOXEL_CORNERS = [0,1,3,2,4,5,7,6]
+
+# VTK cell type -> (number of corner nodes, decomposition of the corners into tetrahedra)
+SECTION_CELL_TYPES = {
+    vtk.VTK_TETRA: (4, [[0,1,2,3]]),
+    vtk.VTK_QUADRATIC_TETRA: (4, [[0,1,2,3]]),
+    vtk.VTK_PYRAMID: (5, [[0,1,2,4],[0,2,3,4]]),
+    vtk.VTK_WEDGE: (6, [[0,1,2,3],[1,2,3,4],[2,3,4,5]]),
+    vtk.VTK_QUADRATIC_WEDGE: (6, [[0,1,2,3],[1,2,3,4],[2,3,4,5]]),
+    vtk.VTK_HEXAHEDRON: (8, HEXAHEDRON_TETRAS),
+    vtk.VTK_QUADRATIC_HEXAHEDRON: (8, HEXAHEDRON_TETRAS),
+    vtk.VTK_VOXEL: (8, [[VOXEL_CORNERS[i] for i in tetra] for tetra in HEXAHEDRON_TETRAS]),
+}
+
+# Marching tetrahedra: sign pattern of the 4 vertices -> intersected edges (vertex pairs) in cyclic order
+def make_tetra_cases():
+    triangles = {}
+    quads = {}
+    for code in range(1,15):
+        positive = [v for v in range(4) if code>>v & 1]
+        negative = [v for v in range(4) if not code>>v & 1]
+        if len(positive) == 1 or len(negative) == 1:
+            single,others = (positive[0],negative) if len(positive) == 1 else (negative[0],positive)
+            triangles[code] = [(single,v) for v in others]
+        else:
+            (a,b),(c,d) = positive,negative
+            quads[code] = [(a,c),(a,d),(b,d),(b,c)]
+    return triangles,quads
+
+TETRA_TRIANGLES,TETRA_QUADS = make_tetra_cases()
+
+
+class SectionIndex:
+    # Uniform grid over the cells of a volume mesh, built once and queried for every plane.
+    # Each cell is binned by the center of its bounding box; every bin keeps the largest
+    # half extent of its cells so that a bin can be rejected conservatively.
+    def __init__(self,vtu,cells_per_bin=8,chunksize=1<<20):
+        self.points_ = numpy.ascontiguousarray(vtu.points(),dtype=numpy.float64)
+        connectivity = vtu.cells_connectivity()
+        offsets = vtu.cells_offsets()
+        types = vtu.cells_types()
+        # Corner nodes of each supported cell, grouped by cell type
+        self.groups_ = []
+        for cell_type,(ncorners,tetras) in SECTION_CELL_TYPES.items():
+            cell_ids = numpy.flatnonzero(types == cell_type)
+            if len(cell_ids) == 0:
+                continue
+            corners = connectivity[offsets[cell_ids][:,None]+numpy.arange(ncorners)]
+            self.groups_.append((corners,numpy.array(tetras)))
+        ncells = sum(len(corners) for corners,tetras in self.groups_)
+        self.ncells_ = ncells
+        if ncells == 0:
+            return
+        # Bounding box center and half extent of each cell (in chunks to bound temporaries)
+        center = numpy.empty((ncells,3))
+        extent = numpy.empty((ncells,3))
+        i = 0
+        for corners,tetras in self.groups_:
+            for start in range(0,len(corners),chunksize):
+                p = self.points_[corners[start:start+chunksize]]
+                p_min = p.min(axis=1)
+                p_max = p.max(axis=1)
+                center[i:i+len(p)] = 0.5*(p_min+p_max)
+                extent[i:i+len(p)] = 0.5*(p_max-p_min)
+                i += len(p)
+        # Grid with about cells_per_bin cells per bin
+        lo = center.min(axis=0)
+        hi = center.max(axis=0)
+        # Centers of a single layer/row of cells have no spread along some axis: use the cell size there
+        size = numpy.maximum(hi-lo,2.0*extent.max(axis=0))
+        active = size > 1e-12*max(size.max(),1.0)
+        size = numpy.where(active,size,max(size.max(),1.0))
+        nactive = max(int(active.sum()),1)
+        bin_size = (numpy.prod(size[active])*cells_per_bin/ncells)**(1.0/nactive)
+        dims = numpy.where(active,numpy.ceil(size/bin_size),1.0)
+        # Keep the number of bins (and the bincount below) around ncells/cells_per_bin
+        max_bins = max(ncells//cells_per_bin,1)
+        if numpy.prod(dims) > max_bins:
+            dims = numpy.floor(dims*(max_bins/numpy.prod(dims))**(1.0/nactive))
+        self.dims_ = numpy.clip(dims,1,None).astype(numpy.int64)
+        self.lo_ = lo
+        self.bin_size_ = size/self.dims_
+        ijk = numpy.clip(((center-lo)/self.bin_size_).astype(numpy.int64),0,self.dims_-1)
+        bins = (ijk[:,0]*self.dims_[1]+ijk[:,1])*self.dims_[2]+ijk[:,2]
+        self.order_ = numpy.argsort(bins,kind="stable")
+        counts = numpy.bincount(bins,minlength=numpy.prod(self.dims_))
+        self.bin_start_ = numpy.concatenate([[0],numpy.cumsum(counts)])
+        # Per non-empty bin: center and (bin half size + largest cell half extent)
+        self.bins_ = numpy.flatnonzero(counts)
+        bin_ijk = numpy.stack(numpy.unravel_index(self.bins_,self.dims_),axis=1)
+        self.bin_center_ = lo+(bin_ijk+0.5)*self.bin_size_
+        self.bin_extent_ = 0.5*self.bin_size_+numpy.maximum.reduceat(extent[self.order_],self.bin_start_[self.bins_],axis=0)
+        # Global cell index -> (group, row in group)
+        self.group_start_ = numpy.cumsum([0]+[len(corners) for corners,tetras in self.groups_])
+    def query(self,origin,normal):
+        # Cells whose bin may intersect the plane
+        if self.ncells_ == 0:
+            return numpy.zeros(0,dtype=numpy.int64)
+        distance = (self.bin_center_-origin)@normal
+        radius = self.bin_extent_@numpy.abs(normal)
+        bins = self.bins_[numpy.abs(distance) <= radius]
+        start = self.bin_start_[bins]
+        count = self.bin_start_[bins+1]-start
+        index = numpy.repeat(start-numpy.cumsum(count)+count,count)+numpy.arange(count.sum())
+        return numpy.sort(self.order_[index])
+    def cut(self,origin,normal,point_arrays=None):
+        # Plane-cell intersection polygons: returns (vertices, face_offsets, face_vertices, {name: values})
+        origin = numpy.asarray(origin,dtype=numpy.float64)
+        normal = numpy.asarray(normal,dtype=numpy.float64)
+        normal = normal/numpy.linalg.norm(normal)
+        point_arrays = point_arrays or {}
+        cells = self.query(origin,normal)
+        tetras = []
+        for g,(corners,tetra_table) in enumerate(self.groups_):
+            rows = cells[(cells >= self.group_start_[g]) & (cells < self.group_start_[g+1])]-self.group_start_[g]
+            if len(rows) == 0:
+                continue
+            c = corners[rows]
+            positive = (self.points_[c]-origin)@normal > 0
+            straddle = positive.any(axis=1) & ~positive.all(axis=1)
+            tetras.append(c[straddle][:,tetra_table].reshape(-1,4))
+        empty = (numpy.zeros((0,3)),numpy.zeros(1,dtype=numpy.int64),numpy.zeros(0,dtype=numpy.int64),{name: numpy.zeros((0,)+values.shape[1:]) for name,values in point_arrays.items()})
+        if not tetras:
+            return empty
+        tetras = numpy.concatenate(tetras)
+        distance = (self.points_[tetras]-origin)@normal
+        code = (distance > 0)@numpy.array([1,2,4,8])
+        # Intersected edges of every face, as (point, point) pairs
+        edges = []
+        sizes = []
+        for cases,nedges in [(TETRA_TRIANGLES,3),(TETRA_QUADS,4)]:
+            for case,case_edges in cases.items():
+                t = tetras[code == case]
+                if len(t) == 0:
+                    continue
+                case_edges = numpy.array(case_edges)
+                edges.append(numpy.stack([t[:,case_edges[:,0]],t[:,case_edges[:,1]]],axis=2).reshape(-1,2))
+                sizes.append(numpy.full(len(t),nedges))
+        if not edges:
+            return empty
+        edges = numpy.sort(numpy.concatenate(edges),axis=1)
+        sizes = numpy.concatenate(sizes)
+        # One vertex per intersected edge, shared by the neighboring faces
+        keys = edges[:,0].astype(numpy.int64)*len(self.points_)+edges[:,1]
+        keys,first,face_vertices = numpy.unique(keys,return_index=True,return_inverse=True)
+        p0,p1 = edges[first,0],edges[first,1]
+        d0 = (self.points_[p0]-origin)@normal
+        d1 = (self.points_[p1]-origin)@normal
+        t = (d0/(d0-d1))[:,None]
+        vertices = self.points_[p0]*(1-t)+self.points_[p1]*t
+        arrays = {}
+        for name,values in point_arrays.items():
+            w = t if values.ndim > 1 else t[:,0]
+            arrays[name] = values[p0]*(1-w)+values[p1]*w
+        face_offsets = numpy.concatenate([[0],numpy.cumsum(sizes)])
+        face_vertices = face_vertices.ravel()
+        # Orient the faces along the plane normal
+        position = numpy.arange(len(face_vertices))-numpy.repeat(face_offsets[:-1],sizes)
+        following = numpy.repeat(face_offsets[:-1],sizes)+(position+1)%numpy.repeat(sizes,sizes)
+        v = vertices[face_vertices]
+        flip = numpy.add.reduceat(numpy.cross(v,v[following])@normal,face_offsets[:-1]) < 0
+        if flip.any():
+            reverse = numpy.repeat(face_offsets[:-1]+sizes-1,sizes)-position
+            face_vertices = numpy.where(numpy.repeat(flip,sizes),face_vertices[reverse],face_vertices)
+        return vertices,face_offsets,face_vertices,arrays
+
+
+# Volumes kept in memory for the section view: (file, mesh file, mtimes) -> (SectionIndex, point arrays)
+SECTION_VOLUMES = {}
+# Volume key and plane matrix last used for each section object
+SECTION_PLANES = {}
+
+def file_mtime(filepath):
+    try:
+        return os.path.getmtime(filepath)
+    except OSError:
+        return None
+
+def section_volume_key(source):
+    # Files are re-read when they change or another file is imported under the same object name
+    filepath = bpy.path.abspath(source["fistr_filepath"])
+    mesh_filepath = bpy.path.abspath(source.get("fistr_mesh_filepath",""))
+    return (filepath,mesh_filepath,file_mtime(filepath),file_mtime(mesh_filepath) if mesh_filepath else None)
+
+def get_section_volume(source):
+    key = section_volume_key(source)
+    if key not in SECTION_VOLUMES:
+        vtu = read_data(source["fistr_filepath"], mesh_filepath=source.get("fistr_mesh_filepath"))
+        point_arrays = {}
+        for name in [ATTRIBUTE_NAME_DISPLACEMENT,ATTRIBUTE_NAME_MISES_STRESS]:
+            values = vtu.point_attribute_array(name)
+            if values is not None:
+                point_arrays[name] = numpy.asarray(values,dtype=numpy.float64)
+        SECTION_VOLUMES[key] = (SectionIndex(vtu),point_arrays)
+    return SECTION_VOLUMES[key]
+
+def release_section_volumes(sections):
+    # Free the volumes no longer cut by any section (deleted source object, changed file)
+    used = {section_volume_key(section.parent) for section in sections if section.parent and "fistr_filepath" in section.parent}
+    for key in [key for key in SECTION_VOLUMES if key not in used]:
+        del SECTION_VOLUMES[key]
+    names = {section.name for section in sections}
+    for name in [name for name in SECTION_PLANES if name not in names]:
+        del SECTION_PLANES[name]
+
+def update_section(section):
+    source = section.parent
+    plane = bpy.data.objects.get(section.get("fistr_section_plane",""))
+    if source is None or plane is None or "fistr_filepath" not in source:
+        return
+    # Plane in the local coordinates of the source object
+    matrix = source.matrix_world.inverted() @ plane.matrix_world
+    key = (section_volume_key(source),tuple(tuple(row) for row in matrix))
+    if SECTION_PLANES.get(section.name) == key:
+        return
+    SECTION_PLANES[section.name] = key
+    index,point_arrays = get_section_volume(source)
+    origin = numpy.array(matrix.translation)
+    normal = numpy.array(matrix.to_3x3().col[2])
+    vertices,face_offsets,face_vertices,arrays = index.cut(origin,normal,point_arrays)
+    mesh = section.data
+    mesh.clear_geometry()
+    mesh.vertices.add(len(vertices))
+    mesh.vertices.foreach_set("co",vertices.astype(numpy.float32).ravel())
+    mesh.loops.add(len(face_vertices))
+    mesh.loops.foreach_set("vertex_index",face_vertices.astype(numpy.int32))
+    mesh.polygons.add(len(face_offsets)-1)
+    mesh.polygons.foreach_set("loop_start",face_offsets[:-1].astype(numpy.int32))
+    for name,values in arrays.items():
+        if values.ndim > 1:
+            mesh.attributes.new(name=name,type='FLOAT_VECTOR',domain='POINT')
+            mesh.attributes[name].data.foreach_set("vector",values.astype(numpy.float32).ravel())
+        else:
+            mesh.attributes.new(name=name,type='FLOAT',domain='POINT')
+            mesh.attributes[name].data.foreach_set("value",values.astype(numpy.float32))
+    mesh.update()
+
+@bpy.app.handlers.persistent
+def section_depsgraph_update_post(scene, depsgraph):
+    for obj in scene.objects:
+        if "fistr_section_plane" in obj:
+            update_section(obj)
+    release_section_volumes([obj for obj in bpy.data.objects if "fistr_section_plane" in obj])
+
+@bpy.app.handlers.persistent
+def section_load_pre(*args):
+    # Volumes of the previous .blend file
+    SECTION_VOLUMES.clear()
+    SECTION_PLANES.clear()
+
+def new_section_geonodes(source):
+    # Copy of the source geometry nodes without the wireframe branch
+    modifier = next((m for m in source.modifiers if m.type == 'NODES' and m.node_group),None)
+    if modifier is None:
+        return None
+    geonodes = modifier.node_group.copy()
+    geonodes.name = f"{source.name}.section.geonodes"
+    material = source.data.materials[0] if source.data.materials else None
+    node_output = next((n for n in geonodes.nodes if n.bl_idname == "NodeGroupOutput"),None)
+    for node in geonodes.nodes:
+        if node.bl_idname == "GeometryNodeSetMaterial" and node.inputs[2].default_value == material and node_output:
+            geonodes.links.new(node.outputs[0],node_output.inputs[0])
+    return geonodes
+
+
+class FISTR_AddSectionCut(bpy.types.Operator):
+    bl_idname = "fistr.add_section_cut"
+    bl_label = "FrontISTR Section Cut"
+    bl_description = "Add a section plane showing the interior of the active imported object"
+    bl_options = {'REGISTER','UNDO'}
+
+    @classmethod
+    def poll(cls, context):
+        return context.active_object is not None and "fistr_filepath" in context.active_object
+
+    def execute(self, context):
+        import mathutils
+        source = context.active_object
+        try:
+            index,point_arrays = get_section_volume(source)
+        except (ValueError,OSError) as e:
+            self.report({'ERROR'}, str(e))
+            return {'CANCELLED'}
+        if index.ncells_ == 0:
+            self.report({'ERROR'}, "No volume cells to cut")
+            return {'CANCELLED'}
+
+        # Create plane (empty whose Z axis is the plane normal) at the center of the volume
+        lo = index.points_.min(axis=0)
+        hi = index.points_.max(axis=0)
+        plane = bpy.data.objects.new(f"{source.name}.section_plane", None)
+        plane.empty_display_type = 'SINGLE_ARROW'
+        plane.empty_display_size = float((hi-lo).max())*0.5
+        plane.parent = source
+        plane.location = tuple(0.5*(lo+hi))
+        context.collection.objects.link(plane)
+
+        # Create section object
+        mesh = bpy.data.meshes.new(name=f"{source.name}.section.mesh")
+        section = bpy.data.objects.new(f"{source.name}.section", mesh)
+        section.parent = source
+        section["fistr_section_plane"] = plane.name
+        context.collection.objects.link(section)
+        geonodes = new_section_geonodes(source)
+        if geonodes is not None:
+            modifier = section.modifiers.new(name=bpy.app.translations.pgettext_data("Geometry Nodes"), type='NODES')
+            modifier.node_group = geonodes
+        update_section(section)
+
+        # Select plane to drag it
+        for obj in context.selected_objects:
+            obj.select_set(False)
+        plane.select_set(True)
+        context.view_layer.objects.active = plane
+        return {'FINISHED'}
+
+
+def menu_func_object(self, context):
+    self.layout.operator(FISTR_AddSectionCut.bl_idname)
+
+def register():
+    bpy.utils.register_class(FISTR_AddSectionCut)
+    bpy.types.VIEW3D_MT_object.append(menu_func_object)
+    bpy.app.handlers.depsgraph_update_post.append(section_depsgraph_update_post)
+    bpy.app.handlers.load_pre.append(section_load_pre)
+
+def unregister():
+    bpy.app.handlers.load_pre.remove(section_load_pre)
+    bpy.app.handlers.depsgraph_update_post.remove(section_depsgraph_update_post)
+    bpy.types.VIEW3D_MT_object.remove(menu_func_object)
+    bpy.utils.unregister_class(FISTR_AddSectionCut)
+    SECTION_VOLUMES.clear()
+    SECTION_PLANES.clear()